@@ -1,20 +1,198 @@
-from typing import Dict, List, Any, Optional
+import asyncio
+import logging
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, List, Any, Literal, Optional
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 import yfinance as yf
 import pandas as pd
 from datetime import datetime, timedelta
-import os
+from dateutil.relativedelta import relativedelta
+from .llm_client import get_gemini_llm
 from .step_classifier import StepClassifier, AgentType
 
+logger = logging.getLogger(__name__)
+
+try:
+    from yfinance.data import YfData
+except ImportError:  # older yfinance without the shared cookie/crumb client
+    YfData = None
+
+_QUOTE_SUMMARY_URL = "https://query2.finance.yahoo.com/v10/finance/quoteSummary/{}"
+
+# .info and quoteSummary payloads are quasi-static, so reuse them for a while across steps
+_INFO_TTL_SECONDS = 900
+_INFO_CACHE_MAXSIZE = 2048
+_info_cache: Dict[str, tuple] = {}
+_info_cache_lock = threading.Lock()
+
+def _cached_payload(key: Any, fetch) -> Dict:
+    """Return a cached yfinance payload for key, calling fetch once the TTL expires"""
+    now = time.monotonic()
+    with _info_cache_lock:
+        entry = _info_cache.get(key)
+        if entry and now - entry[0] < _INFO_TTL_SECONDS:
+            return entry[1]
+    
+    payload = fetch()
+    
+    with _info_cache_lock:
+        # Refreshing an existing key replaces it in place; only new keys need room
+        if key not in _info_cache and len(_info_cache) >= _INFO_CACHE_MAXSIZE:
+            _info_cache.pop(next(iter(_info_cache)))
+        _info_cache[key] = (now, payload)
+    return payload
+
+def _cached_info(symbol: str) -> Dict:
+    """Return the .info payload for a symbol, refetching once the TTL expires"""
+    symbol = symbol.upper()
+    # yf.Ticker memoizes .info on the instance, so a fresh one is needed for each refetch
+    return _cached_payload(symbol, lambda: yf.Ticker(symbol).info)
+
+def _fetch_quote_summary(symbol: str, modules: tuple) -> Dict:
+    """Fetch only the given quoteSummary modules and flatten them like .info does"""
+    data = YfData().get_raw_json(
+        _QUOTE_SUMMARY_URL.format(symbol),
+        params={"modules": ",".join(modules), "formatted": "false"}
+    )
+    result = data["quoteSummary"]["result"][0]
+    flat = {}
+    for module in modules:
+        for key, value in (result.get(module) or {}).items():
+            if isinstance(value, dict) and "raw" in value:
+                value = value["raw"]
+            flat.setdefault(key, value)
+    return flat
+
+def _cached_quote_summary(symbol: str, modules: tuple) -> Dict:
+    """Return the flattened quoteSummary payload for a symbol, refetching once the TTL expires"""
+    symbol = symbol.upper()
+    return _cached_payload(
+        (symbol, modules), lambda: _fetch_quote_summary(symbol, modules)
+    )
+
+def clear_info_cache() -> None:
+    """Drop all memoized .info and quoteSummary payloads"""
+    with _info_cache_lock:
+        _info_cache.clear()
+
+# yfinance period presets that can stand in for an explicit start/end window ending today
+_PERIOD_PRESETS = (
+    ('1mo', relativedelta(months=1)),
+    ('3mo', relativedelta(months=3)),
+    ('6mo', relativedelta(months=6)),
+    ('1y', relativedelta(years=1)),
+    ('2y', relativedelta(years=2)),
+    ('5y', relativedelta(years=5)),
+    ('10y', relativedelta(years=10)),
+)
+_PERIOD_TOLERANCE = timedelta(days=3)
+
+def _window_to_period(start_date: str, end_date: str) -> Optional[str]:
+    """Return the yfinance period preset matching a start/end window, if any"""
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+    
+    # Presets are anchored to today, so only windows ending now can use them
+    today = datetime.now().date()
+    if abs(end - today) > _PERIOD_TOLERANCE:
+        return None
+    
+    if start == today.replace(month=1, day=1):
+        return 'ytd'
+    for period, span in _PERIOD_PRESETS:
+        if abs(start - (today - span)) <= _PERIOD_TOLERANCE:
+            return period
+    return None
+
+# Available YFinance metrics, grouped by category
+AVAILABLE_METRICS = MappingProxyType({
+    # Market Data
+    'price': ('currentPrice', 'previousClose', 'open', 'dayLow', 'dayHigh'),
+    'volume': ('volume', 'averageVolume', 'averageVolume10days'),
+    'market_stats': ('marketCap', 'impliedSharesOutstanding', 'sharesOutstanding', 'floatShares'),
+    'moving_averages': ('fiftyDayAverage', 'twoHundredDayAverage'),
+    
+    # Valuation
+    'pe_ratios': ('trailingPE', 'forwardPE', 'trailingPegRatio'),
+    'price_ratios': ('priceToBook', 'priceToSalesTrailing12Months'),
+    'enterprise': ('enterpriseValue', 'enterpriseToRevenue', 'enterpriseToEbitda'),
+    
+    # Financial Performance
+    'margins': ('profitMargins', 'grossMargins', 'operatingMargins', 'ebitdaMargins'),
+    'returns': ('returnOnAssets', 'returnOnEquity'),
+    'growth': ('earningsGrowth', 'revenueGrowth', 'earningsQuarterlyGrowth'),
+    
+    # Income Statement
+    'revenue': ('totalRevenue', 'revenuePerShare'),
+    'earnings': ('trailingEps', 'forwardEps', 'netIncomeToCommon'),
+    'other_income': ('ebitda', 'freeCashflow', 'operatingCashflow'),
+    
+    # Balance Sheet
+    'cash_debt': ('totalCash', 'totalCashPerShare', 'totalDebt'),
+    'ratios': ('quickRatio', 'currentRatio', 'debtToEquity'),
+    'book_value': ('bookValue', 'priceToBook')
+})
+
+_ALL_AVAILABLE_METRICS = frozenset(
+    metric for metrics in AVAILABLE_METRICS.values() for metric in metrics
+)
+
+# quoteSummary module backing each metric; metrics missing here are only available via .info
+_METRIC_MODULES = MappingProxyType({
+    **dict.fromkeys(
+        ('currentPrice', 'profitMargins', 'grossMargins', 'operatingMargins', 'ebitdaMargins',
+         'returnOnAssets', 'returnOnEquity', 'earningsGrowth', 'revenueGrowth',
+         'totalRevenue', 'revenuePerShare', 'ebitda', 'freeCashflow', 'operatingCashflow',
+         'totalCash', 'totalCashPerShare', 'totalDebt', 'quickRatio', 'currentRatio',
+         'debtToEquity'),
+        'financialData'
+    ),
+    **dict.fromkeys(
+        ('previousClose', 'open', 'dayLow', 'dayHigh', 'volume', 'averageVolume',
+         'averageVolume10days', 'marketCap', 'fiftyDayAverage', 'twoHundredDayAverage',
+         'trailingPE', 'forwardPE', 'priceToSalesTrailing12Months'),
+        'summaryDetail'
+    ),
+    **dict.fromkeys(
+        ('impliedSharesOutstanding', 'sharesOutstanding', 'floatShares', 'priceToBook',
+         'enterpriseValue', 'enterpriseToRevenue', 'enterpriseToEbitda',
+         'earningsQuarterlyGrowth', 'trailingEps', 'forwardEps', 'netIncomeToCommon',
+         'bookValue'),
+        'defaultKeyStatistics'
+    ),
+})
+
+def _modules_for(metrics: List[str]) -> Optional[tuple]:
+    """Return the quoteSummary modules covering metrics, or None if any needs the full .info"""
+    if YfData is None or not metrics or any(m not in _METRIC_MODULES for m in metrics):
+        return None
+    return tuple(sorted({_METRIC_MODULES[m] for m in metrics}))
+
+# Restricting metrics to this enum lets the structured output schema reject unknown names
+MetricName = Literal[tuple(sorted(_ALL_AVAILABLE_METRICS))]
+
 class DataRequest(BaseModel):
     """Schema for translating decomposed steps into yfinance API calls"""
-    metrics: List[str] = Field(description="YFinance metrics to fetch")
+    metrics: List[MetricName] = Field(description="YFinance metrics to fetch")
     tickers: List[str] = Field(description="Stock symbols to analyze")
     start_date: Optional[str] = Field(description="Start date for historical data")
     end_date: Optional[str] = Field(description="End date for historical data")
     frequency: Optional[str] = Field(description="Data frequency (1d, 1wk, 1mo, 1q)")
+    
+    @field_validator('metrics', mode='before')
+    @classmethod
+    def _drop_unknown_metrics(cls, value):
+        """Drop metric names outside the list instead of failing the whole request"""
+        # Function-calling output does not enforce the enum, so unknown names can still arrive
+        if isinstance(value, (list, tuple)):
+            return [m for m in value if m in _ALL_AVAILABLE_METRICS]
+        return value
 
 class DataRetrievalAgent:
     """
@@ -22,42 +200,19 @@ class DataRetrievalAgent:
     using YFinance APIs.
     """
     
+    AVAILABLE_METRICS = AVAILABLE_METRICS
+    
+    # Number of rows spanning one year at each supported frequency
+    GROWTH_PERIODS = {'1d': 252, '1wk': 52, '1mo': 12, '1q': 4}
+    
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash-latest",
-            google_api_key=os.getenv("GOOGLE_API_KEY"),
-            temperature=0
-        )
+        self.llm = get_gemini_llm()
+        # Have the model return a DataRequest directly instead of free-form JSON text
+        self.structured_llm = self.llm.with_structured_output(DataRequest)
+        
+        # Bound concurrent yfinance requests to stay under Yahoo's rate limit
+        self._fetch_semaphore = asyncio.Semaphore(8)
         
-        # Define available YFinance metrics as class attribute
-        self.AVAILABLE_METRICS = {
-            # Market Data
-            'price': ['currentPrice', 'previousClose', 'open', 'dayLow', 'dayHigh'],
-            'volume': ['volume', 'averageVolume', 'averageVolume10days'],
-            'market_stats': ['marketCap', 'impliedSharesOutstanding', 'sharesOutstanding', 'floatShares'],
-            'moving_averages': ['fiftyDayAverage', 'twoHundredDayAverage'],
-            
-            # Valuation
-            'pe_ratios': ['trailingPE', 'forwardPE', 'trailingPegRatio'],
-            'price_ratios': ['priceToBook', 'priceToSalesTrailing12Months'],
-            'enterprise': ['enterpriseValue', 'enterpriseToRevenue', 'enterpriseToEbitda'],
-            
-            # Financial Performance
-            'margins': ['profitMargins', 'grossMargins', 'operatingMargins', 'ebitdaMargins'],
-            'returns': ['returnOnAssets', 'returnOnEquity'],
-            'growth': ['earningsGrowth', 'revenueGrowth', 'earningsQuarterlyGrowth'],
-            
-            # Income Statement
-            'revenue': ['totalRevenue', 'revenuePerShare'],
-            'earnings': ['trailingEps', 'forwardEps', 'netIncomeToCommon'],
-            'other_income': ['ebitda', 'freeCashflow', 'operatingCashflow'],
-            
-            # Balance Sheet
-            'cash_debt': ['totalCash', 'totalCashPerShare', 'totalDebt'],
-            'ratios': ['quickRatio', 'currentRatio', 'debtToEquity'],
-            'book_value': ['bookValue', 'priceToBook']
-        }
-
         self.translation_prompt = ChatPromptTemplate.from_messages([
             ("system", """You are an expert in translating financial analysis steps into YFinance API calls.
             
@@ -84,6 +239,12 @@ Output: {{
             ("user", "Step to translate: {step_description}")
         ])
 
+        # The metrics listing is static, so render it once and bind it into the prompt
+        self._metrics_info_str = self._get_metrics_info()
+        self.translation_prompt = self.translation_prompt.partial(
+            metrics_info=self._metrics_info_str
+        )
+
     def _get_metrics_info(self) -> str:
         """Format available metrics info for prompt"""
         info = []
@@ -93,120 +254,227 @@ Output: {{
             info.append("")
         return "\n".join(info)
 
+    def _default_request(self, step: Dict) -> DataRequest:
+        """Return a default request with minimal data"""
+        return DataRequest(
+            metrics=['currentPrice'],
+            tickers=step.get('tickers', []),
+            start_date=None,
+            end_date=None,
+            frequency=None
+        )
+
+    def _finalize_request(self, step: Dict, request: Optional[DataRequest]) -> DataRequest:
+        """Normalize a structured LLM translation and attach the step's tickers"""
+        if request is None:
+            print("Error in translation: empty structured response")
+            print(f"Step was: {step}")
+            return self._default_request(step)
+        print("LLM structured response:", request)
+        
+        # Unknown metric names were already dropped by the schema validator
+        metrics = list(request.metrics) or ['currentPrice']
+        
+        # Handle tickers
+        tickers = list(request.tickers or [])
+        if 'tickers' in step:
+            tickers.extend(step['tickers'])
+        
+        # Validate frequency
+        frequency = request.frequency
+        if frequency is not None and frequency not in ['1d', '1wk', '1mo', '1q']:
+            frequency = '1d'
+        
+        return request.model_copy(update={
+            'metrics': metrics,
+            'tickers': tickers,
+            'frequency': frequency
+        })
+
+    def _format_translation_prompt(self, step: Dict) -> List:
+        """Prepare the translation prompt for a step"""
+        return self.translation_prompt.format_messages(
+            step_description=step["description"]
+        )
+
     async def _translate_step_to_request(self, step: Dict) -> DataRequest:
         """Translate a decomposition step into specific YFinance parameters"""
         try:
-            # Prepare prompt with metrics info
-            formatted_prompt = self.translation_prompt.format_messages(
-                metrics_info=self._get_metrics_info(),
-                step_description=step["description"]
-            )
-            
-            # Get LLM response using ainvoke
-            response = await self.llm.ainvoke(formatted_prompt)
-            
-            # Extract content from response
-            content = response.content if hasattr(response, 'content') else str(response)
-            print("LLM response content:", content)
-            
-            # Parse JSON from response
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0]
-            import json
-            data = json.loads(content.strip())
-            # print("Parsed data:", data)
-            
-            # Validate metrics against available ones
-            all_available_metrics = [
-                metric for metrics in self.AVAILABLE_METRICS.values()
-                for metric in metrics
-            ]
-            data['metrics'] = [
-                metric for metric in data.get('metrics', [])
-                if metric in all_available_metrics
-            ]
-            
-            # If no valid metrics found, use default
-            if not data['metrics']:
-                data['metrics'] = ['currentPrice']
-            
-            # Handle tickers
-            if 'tickers' not in data:
-                data['tickers'] = []
-            if 'tickers' in step:
-                data['tickers'].extend(step['tickers'])
-            
-            # Validate frequency
-            if 'frequency' in data and data['frequency'] not in ['1d', '1wk', '1mo', '1q']:
-                data['frequency'] = '1d'
-            
-            return DataRequest(**data)
-            
+            response = await self.structured_llm.ainvoke(self._format_translation_prompt(step))
         except Exception as e:
             print(f"Error in translation: {e}")
             print(f"Step was: {step}")
-            # Return a default request with minimal data
-            return DataRequest(
-                metrics=['currentPrice'],
-                tickers=step.get('tickers', []),
-                start_date=None,
-                end_date=None,
-                frequency=None
+            return self._default_request(step)
+        return self._finalize_request(step, response)
+
+    async def _translate_steps_to_requests(self, steps: List[Dict]) -> List[DataRequest]:
+        """Translate several steps with one batched, concurrent LLM call"""
+        if not steps:
+            return []
+        responses = await self.structured_llm.abatch(
+            [self._format_translation_prompt(step) for step in steps],
+            config={"max_concurrency": 8},
+            return_exceptions=True
+        )
+        requests = []
+        for step, response in zip(steps, responses):
+            if isinstance(response, Exception):
+                print(f"Error in translation: {response}")
+                print(f"Step was: {step}")
+                requests.append(self._default_request(step))
+            else:
+                requests.append(self._finalize_request(step, response))
+        return requests
+
+    def _fetch_one_info(self, ticker: str, metrics: List[str]) -> Optional[Dict]:
+        """Fetch the fundamental info payload for a single ticker"""
+        try:
+            # Pull only the quoteSummary modules holding the metrics, falling back to .info
+            modules = _modules_for(metrics)
+            info = None
+            if modules:
+                try:
+                    info = _cached_quote_summary(ticker, modules)
+                except Exception as e:
+                    logger.debug("quoteSummary failed for %s, using .info: %s", ticker, e)
+            if info is None:
+                info = _cached_info(ticker)
+            logger.debug("info for %s: %s", ticker, info)
+            return info
+        except Exception as e:
+            print(f"Error fetching data for {ticker}: {e}")
+            return None
+
+    def _download_history(self, tickers: List[str], start_date: str,
+                          end_date: str, interval: str) -> Dict[str, pd.DataFrame]:
+        """Download historical prices for all tickers in one batched request"""
+        tickers = [t.upper() for t in tickers]
+        period = _window_to_period(start_date, end_date)
+        window = {'period': period} if period else {'start': start_date, 'end': end_date}
+        try:
+            wide = yf.download(
+                tickers,
+                **window,
+                interval=interval,
+                group_by='ticker',
+                auto_adjust=True,
+                threads=True,
+                progress=False
             )
+        except Exception as e:
+            print(f"Error fetching historical data for {tickers}: {e}")
+            return {}
+        
+        if not isinstance(wide.columns, pd.MultiIndex):
+            return {tickers[0]: wide} if len(tickers) == 1 else {}
+        
+        available = set(wide.columns.get_level_values(0))
+        return {
+            t: wide[t].dropna(how='all')
+            for t in tickers if t in available
+        }
+
+    async def _run_limited(self, func, *args):
+        """Run a blocking yfinance call in a worker thread, bounded by the fetch semaphore"""
+        async with self._fetch_semaphore:
+            return await asyncio.to_thread(func, *args)
 
-    def _fetch_fundamental_data(self, tickers: List[str], metrics: List[str]) -> pd.DataFrame:
+    async def _fetch_fundamental_data(self, tickers: List[str], metrics: List[str]) -> pd.DataFrame:
         """Fetch fundamental data ensuring only valid metrics"""
-        all_available_metrics = [
-            metric for metrics in self.AVAILABLE_METRICS.values()
-            for metric in metrics
-        ]
-        print("all_available_metrics", all_available_metrics)
-        valid_metrics = [m for m in metrics if m in all_available_metrics]
-        print("valid_metrics", valid_metrics)
-        data = []
-        for ticker in tickers:
-            try:
-                stock = yf.Ticker(ticker)
-                info = stock.info
-                print("info", info)
-                row = {"Ticker": ticker}
-                for metric in valid_metrics:
-                    row[metric] = info.get(metric, None)
-                print("row", row)
-                data.append(row)
-            except Exception as e:
-                print(f"Error fetching data for {ticker}: {e}")
+        valid_metrics = [m for m in metrics if m in _ALL_AVAILABLE_METRICS]
+        logger.debug("valid_metrics: %s", valid_metrics)
+        infos = await asyncio.gather(
+            *(self._run_limited(self._fetch_one_info, t, valid_metrics) for t in tickers)
+        )
+        
+        # Build the frame column-wise to skip the per-row dict transpose
+        columns = {"Ticker": [], **{metric: [] for metric in valid_metrics}}
+        for ticker, info in zip(tickers, infos):
+            if info is None:
                 continue
+            columns["Ticker"].append(ticker)
+            for metric in valid_metrics:
+                columns[metric].append(info.get(metric, None))
         
-        return pd.DataFrame(data)
+        return pd.DataFrame(columns, copy=False)
 
-    def _fetch_historical_data(self, tickers: List[str], start_date: str, 
+    async def _fetch_historical_data(self, tickers: List[str], start_date: str, 
                              end_date: str, interval: str) -> Dict[str, pd.DataFrame]:
         """Fetch historical data for given tickers"""
-        data = {}
-        for ticker in tickers:
-            try:
-                stock = yf.Ticker(ticker)
-                df = stock.history(start=start_date, end=end_date, interval=interval)
-                data[ticker] = df
-            except Exception as e:
-                print(f"Error fetching historical data for {ticker}: {e}")
-                continue
+        if not tickers:
+            return {}
+        return await asyncio.to_thread(
+            self._download_history, tickers, start_date, end_date, interval
+        )
+
+    def _calculate_growth_rates(self, data: Dict[str, pd.DataFrame], metric: str,
+                                frequency: Optional[str]) -> Dict[str, pd.DataFrame]:
+        """Calculate YoY growth rates for a given metric across all tickers at once"""
+        frames = {t: df for t, df in data.items() if not df.empty and metric in df}
+        if not frames:
+            return data
+        
+        # One pct_change over a tickers-as-columns block instead of one per ticker
+        periods = self.GROWTH_PERIODS.get(frequency, 252)
+        wide = pd.concat({t: df[metric] for t, df in frames.items()}, axis=1)
+        growth = wide.pct_change(periods)
+        for ticker, df in frames.items():
+            df[f"{metric}_growth"] = growth[ticker]
         return data
 
-    def _calculate_growth_rates(self, df: pd.DataFrame, metric: str) -> pd.DataFrame:
-        """Calculate YoY or QoQ growth rates for a given metric"""
-        if df.empty:
-            return df
-        df[f"{metric}_growth"] = df[metric].pct_change(4 if 'q' in df.index else 252)
-        return df
+    @staticmethod
+    def _request_key(request: DataRequest) -> tuple:
+        """Key identifying the data a request fetches, so identical fetches can be shared"""
+        tickers = frozenset(t.upper() for t in request.tickers)
+        if request.start_date and request.end_date:
+            return ('history', tickers, request.start_date, request.end_date, request.frequency)
+        return ('fundamentals', tickers, frozenset(request.metrics))
+
+    async def _fetch_request(self, request: DataRequest) -> Any:
+        """Fetch the historical or fundamental data described by a request"""
+        # Determine if historical data is needed based on start_date and end_date
+        if request.start_date and request.end_date:
+            print(f"Fetching historical data for {request.tickers} from {request.start_date} to {request.end_date}")
+            # Convert quarterly frequency to monthly since YFinance doesn't support quarterly
+            interval = '1mo' if request.frequency == '1q' else (request.frequency or '1d')
+            historical_data = await self._fetch_historical_data(
+                request.tickers, 
+                request.start_date, 
+                request.end_date, 
+                interval
+            )
+            
+            # If quarterly data was requested, resample the monthly data to quarterly
+            # in one pass over a ticker x field wide frame
+            if request.frequency == '1q' and historical_data:
+                wide = pd.concat(historical_data, axis=1).resample('Q').last()
+                historical_data = {t: wide[t] for t in historical_data}
+            
+            return historical_data
+        
+        # Handle fundamental data for current snapshot
+        print(f"Fetching fundamental data...{request.tickers} {request.metrics}")
+        return await self._fetch_fundamental_data(request.tickers, request.metrics)
+
+    async def _fetch_request_data(self, request: DataRequest,
+                                  shared_fetches: Optional[Dict[tuple, asyncio.Task]]) -> Any:
+        """Fetch a request's data, reusing an identical in-flight or finished fetch if shared"""
+        if shared_fetches is None:
+            return await self._fetch_request(request)
+        key = self._request_key(request)
+        if key not in shared_fetches:
+            shared_fetches[key] = asyncio.ensure_future(self._fetch_request(request))
+        return await shared_fetches[key]
 
-    async def execute_step(self, step: Dict) -> Dict[str, Any]:
+    async def execute_step(self, step: Dict,
+                           request: Optional[DataRequest] = None,
+                           shared_fetches: Optional[Dict[tuple, asyncio.Task]] = None) -> Dict[str, Any]:
         """Execute a single step from the query decomposition"""
         try:
-            # Translate the step into specific API parameters
-            print("****Translating step to request...")
-            request = await self._translate_step_to_request(step)
+            # Translate the step into specific API parameters unless already done
+            if request is None:
+                print("****Translating step to request...")
+                request = await self._translate_step_to_request(step)
             print("****Translated Request", request)
             # Initialize result dictionary
             result = {
@@ -216,29 +484,7 @@ Output: {{
                 "error": None
             }
             
-            # Determine if historical data is needed based on start_date and end_date
-            if request.start_date and request.end_date:
-                print(f"Fetching historical data for {request.tickers} from {request.start_date} to {request.end_date}")
-                # Convert quarterly frequency to monthly since YFinance doesn't support quarterly
-                interval = '1mo' if request.frequency == '1q' else (request.frequency or '1d')
-                historical_data = self._fetch_historical_data(
-                    request.tickers, 
-                    request.start_date, 
-                    request.end_date, 
-                    interval
-                )
-                
-                # If quarterly data was requested, resample the monthly data to quarterly
-                if request.frequency == '1q':
-                    for ticker in historical_data:
-                        historical_data[ticker] = historical_data[ticker].resample('Q').last()
-                
-                result["data"] = historical_data
-            else:
-                # Handle fundamental data for current snapshot
-                print(f"Fetching fundamental data...{request.tickers} {request.metrics}")
-                df = self._fetch_fundamental_data(request.tickers, request.metrics)
-                result["data"] = df
+            result["data"] = await self._fetch_request_data(request, shared_fetches)
              
             print("****Result", result)                   
             return result
@@ -251,29 +497,63 @@ Output: {{
                 "error": str(e)
             }
 
+    @staticmethod
+    def _plan_waves(steps: List[Dict], indices: List[int]) -> List[List[int]]:
+        """Group step indices into waves whose depends_on steps finish in earlier waves"""
+        pending = {steps[i]["step_number"]: i for i in indices}
+        waves = []
+        while pending:
+            # Dependencies on steps that are not pending are already satisfied
+            wave = [
+                i for i in pending.values()
+                if not any(dep in pending for dep in steps[i].get("depends_on") or [])
+            ]
+            if not wave:
+                # Cyclic dependencies: run the remaining steps together
+                wave = list(pending.values())
+            waves.append(wave)
+            for i in wave:
+                pending.pop(steps[i]["step_number"])
+        return waves
+
     async def execute_plan(self, decomposed_query: Dict) -> List[Dict[str, Any]]:
         """Execute all steps in the decomposed query"""
-        results = []
+        steps = decomposed_query["steps"]
+        results = [None] * len(steps)
         classifier = StepClassifier()
+        data_indices = []
         
-        for step in decomposed_query["steps"]:
+        for i, step in enumerate(steps):
             agent_type, reason = classifier.classify_step(step)
             print(f"\nStep {step['step_number']}: {step['description']}")
             print(f"Assigned to: {agent_type.value} agent ({reason})")
             
             if agent_type == AgentType.DATA_RETRIEVAL:
                 print(f"Executing step by data retrieval agent...{step}")
-                result = await self.execute_step(step)
+                data_indices.append(i)
             else:
-                result = {
+                results[i] = {
                     "step_number": step["step_number"],
                     "description": step["description"],
                     "data": None,
                     "error": f"Step requires {agent_type.value} agent (not implemented yet)"
                 }
-            
-            results.append(result)
+        
+        # Within each wave of independent steps, translate in one batch and fetch concurrently;
+        # steps asking for the same data across the plan share a single fetch
+        shared_fetches = {}
+        for wave in self._plan_waves(steps, data_indices):
+            wave_steps = [steps[i] for i in wave]
+            requests = await self._translate_steps_to_requests(wave_steps)
+            wave_results = await asyncio.gather(
+                *(self.execute_step(step, request, shared_fetches)
+                  for step, request in zip(wave_steps, requests))
+            )
+            for i, result in zip(wave, wave_results):
+                results[i] = result
+        
+        for step, result in zip(steps, results):
             if result["error"]:
                 print(f"Warning: Step {step['step_number']} failed: {result['error']}")
         
-        return results
\ No newline at end of file
+        return results
@@ -0,0 +1,12 @@
+import asyncio
+
+try:
+    import uvloop
+except ImportError:  # uvloop is optional and unavailable on Windows; keep the default loop
+    uvloop = None
+
+def run(main):
+    """Run a coroutine to completion, on uvloop when it is installed"""
+    if uvloop is not None:
+        return uvloop.run(main)
+    return asyncio.run(main)
@@ -1,9 +1,10 @@
-import asyncio
-import json
+import argparse
+import orjson
 import shutil
 import subprocess
 from pathlib import Path
-from datetime import datetime, date
+from datetime import datetime
+from event_loop import run
 from stock_analyst_agent import StockAnalystAgent
 import os
 import sys
@@ -11,26 +12,14 @@ import sys
 class WebsiteGenerator:
     def __init__(self):
         self.root_dir = Path("website")
+        self.template_cache_dir = Path(".astro-template-cache")
         
     def _check_dependencies(self):
         """Check if required dependencies are installed"""
-        try:
-            # Check for Node.js
-            node_version = subprocess.run(['node', '-v'], capture_output=True, text=True)
-            if node_version.returncode != 0:
-                print("Node.js is not installed. Please install from: https://nodejs.org/")
-                sys.exit(1)
-                
-            # Check for npm
-            npm_version = subprocess.run(['npm', '-v'], capture_output=True, text=True)
-            if npm_version.returncode != 0:
-                print("npm is not installed. Please install Node.js which includes npm")
-                sys.exit(1)
-                
-            print(f"✓ Node.js version: {node_version.stdout.strip()}")
-            print(f"✓ npm version: {npm_version.stdout.strip()}")
-            
-        except FileNotFoundError:
+        # Look both tools up on PATH instead of spawning them just to test they exist
+        node = shutil.which('node')
+        npm = shutil.which('npm')
+        if not node or not npm:
             print("""
 Error: Required dependencies not found.
 Please install:
@@ -38,6 +27,11 @@ Please install:
 2. After installation, restart your terminal and run this script again
             """)
             sys.exit(1)
+        
+        # One subprocess for the version banner; npm ships with Node.js
+        node_version = subprocess.run([node, '-v'], capture_output=True, text=True)
+        print(f"✓ Node.js version: {node_version.stdout.strip()}")
+        print(f"✓ npm found at: {npm}")
             
     def _create_astro_project(self):
         """Create new Astro project with TypeScript"""
@@ -46,12 +40,21 @@ Please install:
             shutil.rmtree(self.root_dir)
             
         try:
-            # Use subprocess for better error handling
-            subprocess.run([
-                'npm', 'create', 'astro@latest', str(self.root_dir),
-                '--', '--template', 'basics', '--typescript', '--install', '--no-git'
-            ], check=True)
+            # Download the template once and copy it for later scaffolds
+            if not self.template_cache_dir.exists():
+                # Scaffold beside the cache and publish it only once npm succeeds, so a failed
+                # or interrupted run never leaves a broken template behind
+                partial_dir = self.template_cache_dir.with_name(self.template_cache_dir.name + ".partial")
+                shutil.rmtree(partial_dir, ignore_errors=True)
+                # Use subprocess for better error handling
+                subprocess.run([
+                    'npm', 'create', 'astro@latest', str(partial_dir),
+                    '--', '--template', 'basics', '--typescript', '--no-install', '--no-git'
+                ], check=True)
+                partial_dir.rename(self.template_cache_dir)
+            shutil.copytree(self.template_cache_dir, self.root_dir, dirs_exist_ok=True)
             
+            # Install the template's dependencies and our extras in a single resolver pass
             subprocess.run([
                 'npm', 'install', '@astrojs/tailwind', '@astrojs/react', 'framer-motion'
             ], cwd=str(self.root_dir), check=True)
@@ -144,9 +147,21 @@ export default function Disclaimer() {
         (components_dir / "StockTable.tsx").write_text(stock_table)
         (components_dir / "Disclaimer.tsx").write_text(disclaimer)
 
-    async def generate_website(self):
-        """Generate Astro website with data"""
-        print("\nGenerating Sankhya AI website...")
+    def _save_recommendations(self, recommendations_df):
+        """Write the recommendations DataFrame to the site's data directory"""
+        data_dir = self.root_dir / "src/data"
+        data_dir.mkdir(parents=True, exist_ok=True)
+        
+        # orjson writes date and numpy values directly, so no per-cell conversion pass is needed
+        data = recommendations_df.to_dict('records')
+        with open(data_dir / "recommendations.json", "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+
+    def scaffold_website(self, force: bool = False):
+        """Create the Astro project and components unless one already exists"""
+        if not force and (self.root_dir / "package.json").exists():
+            print(f"\nReusing existing Astro project at: {self.root_dir.absolute()}")
+            return
         
         # Check dependencies first
         self._check_dependencies()
@@ -156,28 +171,20 @@ export default function Disclaimer() {
         
         # Create components
         self._create_component_files()
+
+    async def generate_website(self, force_scaffold: bool = False):
+        """Generate Astro website with data"""
+        print("\nGenerating Sankhya AI website...")
+        
+        # Scaffold the project only when it is missing or a rebuild was requested
+        self.scaffold_website(force=force_scaffold)
         
         # Get recommendations data
         analyst = StockAnalystAgent()
         recommendations_df = await analyst.analyze_sp500()
         
         # Save recommendations data
-        data = recommendations_df.to_dict('records')
-        data_dir = self.root_dir / "src/data"
-        data_dir.mkdir(exist_ok=True)
-        
-        # Convert date objects to string format
-        def serialize_data(data):
-            # Iterate over each item in the list
-            for item in data:
-                # Serialize each item (which is a dictionary)
-                for key, value in item.items():
-                    if isinstance(value, date):
-                        item[key] = value.isoformat()  # Convert date to string
-            return data  # Return the modified list
-        
-        with open(data_dir / "recommendations.json", "w") as f:
-            json.dump(serialize_data(data), f, indent=2)
+        self._save_recommendations(recommendations_df)
         
         print(f"\nWebsite generated successfully at: {self.root_dir.absolute()}")
         print("To start development server:")
@@ -187,34 +194,30 @@ export default function Disclaimer() {
         """Update only the recommendations data in the website"""
         print("\nUpdating Sankhya AI website data...")
         
+        # Cheap no-op when the project exists; scaffolds a fresh checkout before the long analysis run
+        self.scaffold_website()
+        
         # Get recommendations data
         analyst = StockAnalystAgent()
         recommendations_df = await analyst.analyze_sp500()
         
         # Save recommendations data
-        data = recommendations_df.to_dict('records')
-        data_dir = self.root_dir / "src/data"
-        data_dir.mkdir(exist_ok=True)
-        
-        # Convert date objects to string format
-        def serialize_data(data):
-            # Iterate over each item in the list
-            for item in data:
-                # Serialize each item (which is a dictionary)
-                for key, value in item.items():
-                    if isinstance(value, date):
-                        item[key] = value.isoformat()  # Convert date to string
-            return data  # Return the modified list
-        
-        with open(data_dir / "recommendations.json", "w") as f:
-            json.dump(serialize_data(data), f, indent=2)
+        self._save_recommendations(recommendations_df)
         
         print(f"\nWebsite data updated successfully at: {self.root_dir.absolute()}")
 
 if __name__ == "__main__":
-    generator = WebsiteGenerator()
-    # Comment out full website generation
-    # asyncio.run(generator.generate_website())
+    parser = argparse.ArgumentParser(description="Generate the Sankhya AI website")
+    parser.add_argument(
+        "--scaffold",
+        action="store_true",
+        help="Rebuild the Astro project before writing data (default: only refresh data)"
+    )
+    args = parser.parse_args()
     
-    # Only update recommendations data
-    asyncio.run(generator.update_website_data())
\ No newline at end of file
+    generator = WebsiteGenerator()
+    if args.scaffold:
+        run(generator.generate_website(force_scaffold=True))
+    else:
+        # Only update recommendations data
+        run(generator.update_website_data())
@@ -1,28 +1,218 @@
 import asyncio
-import json
+import hashlib
 from pathlib import Path
-from datetime import datetime
+from datetime import date
+import diskcache
+import httpx
 import yfinance as yf
-from openai import OpenAI
+from aiolimiter import AsyncLimiter
+import orjson
+import openai
+from openai import AsyncOpenAI
 import pandas as pd
-from typing import Dict, List
+import requests
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+from typing import Dict, Optional
 import os
+from event_loop import run
+from yfinance_metrics import get_sp500_tickers
+
+# Retry budget for transient Yahoo/OpenAI failures, overridable from the environment
+YF_RETRIES = int(os.getenv("YF_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.getenv("BACKOFF_MAX", "30"))
+
+RETRYABLE_ERRORS = (
+    requests.HTTPError,
+    requests.ConnectionError,
+    requests.Timeout,
+    ConnectionError,
+    TimeoutError,
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+try:
+    from yfinance.exceptions import YFRateLimitError
+    RETRYABLE_ERRORS += (YFRateLimitError,)
+except ImportError:  # older yfinance surfaces rate limits as HTTP errors
+    pass
+try:
+    # yfinance fetches through curl_cffi, whose errors do not subclass requests' or the builtins
+    from curl_cffi.requests.exceptions import RequestException as CurlRequestException
+    RETRYABLE_ERRORS += (CurlRequestException,)
+except ImportError:  # older yfinance fetches through requests
+    pass
+
+def _is_retryable(error: BaseException) -> bool:
+    """Retry transport failures, rate limits and server errors, but not other 4xx responses"""
+    if not isinstance(error, RETRYABLE_ERRORS):
+        return False
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+_backoff = wait_random_exponential(multiplier=BACKOFF_BASE, max=BACKOFF_MAX)
+
+def _wait_for_retry(retry_state) -> float:
+    """Honor Retry-After on 429 responses, otherwise back off exponentially with jitter"""
+    error = retry_state.outcome.exception()
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        retry_after = response.headers.get("Retry-After")
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except (TypeError, ValueError):
+            pass
+    return _backoff(retry_state)
+
+with_backoff = retry(
+    stop=stop_after_attempt(YF_RETRIES),
+    wait=_wait_for_retry,
+    retry=retry_if_exception(_is_retryable),
+    reraise=True
+)
+
+async def _gather_or_cancel(*coros):
+    """Run coroutines concurrently; if one fails, cancel the rest instead of leaving them blocked"""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# Fixed instructions go first so every request shares a byte-identical prefix
+RECOMMENDATION_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "Analyze the stock metrics you are given and provide a BUY, SELL, or HOLD recommendation.\n"
+        "Give a brief one-sentence rationale."
+    )
+}
+
+# Strict JSON schema so the reply always parses into a valid recommendation
+RECOMMENDATION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "stock_recommendation",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "recommendation": {"type": "string", "enum": ["BUY", "SELL", "HOLD"]},
+                "rationale": {"type": "string"}
+            },
+            "required": ["recommendation", "rationale"],
+            "additionalProperties": False
+        }
+    }
+}
+
+RECOMMENDATION_PROMPT = """Ticker: {ticker}
+PE Ratio: {pe_ratio}
+Market Cap: {market_cap}
+Dividend Yield: {dividend_yield}
+Revenue Growth: {revenue_growth}
+Profit Margins: {profit_margins}
+Debt to Equity: {debt_to_equity}
+Current Price: {current_price}
+Target Price: {target_price}
+"""
+
+# OpenAI clients per API key, all on one warm HTTP/2 connection pool. They are bound to the
+# event loop that first uses them, so close them with close_openai_clients() before it ends
+_openai_http_client: Optional[httpx.AsyncClient] = None
+_openai_clients: Dict[Optional[str], AsyncOpenAI] = {}
+
+def _openai_client(api_key: Optional[str] = None) -> AsyncOpenAI:
+    """Process-wide OpenAI client per API key, built on the shared HTTP/2 pool"""
+    global _openai_http_client
+    client = _openai_clients.get(api_key)
+    if client is None:
+        if _openai_http_client is None:
+            _openai_http_client = httpx.AsyncClient(
+                http2=True,
+                timeout=60.0,
+                limits=httpx.Limits(max_keepalive_connections=64, max_connections=128)
+            )
+        # Retries are handled by with_backoff, so the SDK's own retries would only multiply them
+        client = AsyncOpenAI(api_key=api_key, http_client=_openai_http_client, max_retries=0)
+        _openai_clients[api_key] = client
+    return client
+
+async def close_openai_clients() -> None:
+    """Close the shared OpenAI clients and their pool so a later event loop starts fresh"""
+    global _openai_http_client
+    clients = list(_openai_clients.values())
+    _openai_clients.clear()
+    for client in clients:
+        await client.close()
+    if _openai_http_client is not None:
+        await _openai_http_client.aclose()
+        _openai_http_client = None
 
 class RecommendationsGenerator:
     def __init__(self):
         self.root_dir = Path("website")
-        self.client = OpenAI()
+        self.client = _openai_client(os.getenv("OPENAI_API_KEY"))
+        # Model for the buy/sell/hold analysis, where reasoning quality matters
+        self.analysis_model = "gpt-4o"
+        
+        # Model, instruction or schema changes must not serve recommendations cached under the old ones
+        self._cache_version = hashlib.sha1(orjson.dumps(
+            [self.analysis_model, RECOMMENDATION_SYSTEM_MESSAGE, RECOMMENDATION_RESPONSE_FORMAT],
+            option=orjson.OPT_SORT_KEYS
+        )).hexdigest()
         
-    def get_sp500_tickers(self) -> List[str]:
-        """Get list of S&P 500 tickers"""
-        sp500 = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]
-        return sp500['Symbol'].tolist()
+        # Same-day fundamentals and recommendations are reused across runs
+        self.cache = diskcache.Cache(".cache/sankhya")
+        self.cache_ttl = 24 * 60 * 60
+        
+        # Pipeline sizing, with separate per-minute budgets for Yahoo and OpenAI
+        self.fetch_workers = 16
+        self.recommend_workers = 8
+        self.queue_size = 64
+        self.yf_limiter = AsyncLimiter(60, 60)
+        self.openai_limiter = AsyncLimiter(500, 60)
+        
+    @with_backoff
+    async def _fetch_info(self, ticker: str) -> Dict:
+        """Fetch the .info payload for a stock, retrying transient failures"""
+        # Acquired per attempt so retries after a 429 are paced like first attempts
+        async with self.yf_limiter:
+            # yfinance already shares one browser-impersonating session across all tickers
+            return await asyncio.to_thread(lambda: yf.Ticker(ticker).info)
+
+    @with_backoff
+    async def _create_completion(self, prompt: str):
+        """Request a chat completion, retrying rate limits and transient failures"""
+        # Acquired per attempt so retries also count against the OpenAI budget
+        async with self.openai_limiter:
+            return await self.client.chat.completions.create(
+                model=self.analysis_model,
+                messages=[RECOMMENDATION_SYSTEM_MESSAGE, {"role": "user", "content": prompt}],
+                temperature=0.7,
+                # Room for the JSON wrapper and field names on top of the one-sentence rationale
+                max_tokens=300,
+                response_format=RECOMMENDATION_RESPONSE_FORMAT
+            )
 
-    def fetch_stock_data(self, ticker: str) -> Dict:
+    def _metrics_key(self, ticker: str, today_iso: str) -> str:
+        """Cache key for a ticker's fundamentals on the run's day"""
+        return f"metrics:{ticker}:{today_iso}"
+
+    async def fetch_stock_data(self, ticker: str, today_iso: str = None) -> Dict:
         """Fetch fundamental data for a stock"""
+        # Keyed by the run's date so fundamentals and recommendations agree across midnight
+        key = self._metrics_key(ticker, today_iso or date.today().isoformat())
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
         try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
+            info = await self._fetch_info(ticker)
             
             # Extract key metrics
             metrics = {
@@ -36,101 +226,159 @@ class RecommendationsGenerator:
                 'current_price': info.get('currentPrice', 'N/A'),
                 'target_price': info.get('targetMeanPrice', 'N/A')
             }
+            self.cache.set(key, metrics, expire=self.cache_ttl)
             return metrics
         except Exception as e:
             print(f"Error fetching data for {ticker}: {e}")
             return None
 
-    async def get_gpt4_recommendation(self, metrics: Dict) -> Dict:
+    async def get_gpt4_recommendation(self, metrics: Optional[Dict], ticker: str,
+                                      today_iso: str = None) -> Dict:
         """Get stock recommendation using GPT-4"""
+        # One date stamps every recommendation in a run
+        today_iso = today_iso or date.today().isoformat()
         if not metrics:
             return {
-                "ticker": metrics['ticker'],
+                "ticker": ticker,
                 "recommendation": "HOLD",
                 "rationale": "Insufficient data for analysis",
-                "date": datetime.now().strftime("%Y-%m-%d")
+                "date": today_iso
             }
 
-        prompt = f"""Analyze these stock metrics and provide a BUY, SELL, or HOLD recommendation:
-
-        Ticker: {metrics['ticker']}
-        PE Ratio: {metrics['pe_ratio']}
-        Market Cap: {metrics['market_cap']}
-        Dividend Yield: {metrics['dividend_yield']}
-        Revenue Growth: {metrics['revenue_growth']}
-        Profit Margins: {metrics['profit_margins']}
-        Debt to Equity: {metrics['debt_to_equity']}
-        Current Price: {metrics['current_price']}
-        Target Price: {metrics['target_price']}
+        prompt = RECOMMENDATION_PROMPT.format(**metrics)
 
-        Provide only BUY, SELL, or HOLD followed by a brief one-sentence rationale.
-        Format: RECOMMENDATION: rationale
-        """
+        prompt_hash = hashlib.sha1(prompt.encode()).hexdigest()
+        key = f"rec:{ticker}:{today_iso}:{self._cache_version}:{prompt_hash}"
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=100
-            )
+            response = await self._create_completion(prompt)
             
-            content = response.choices[0].message.content
-            parts = content.split(":", 1)
-            recommendation = "HOLD"
-            rationale = "Insufficient data for analysis"
+            choice = response.choices[0]
+            # A reply cut off at the token limit or a refusal is not valid JSON
+            if choice.finish_reason == "length":
+                raise ValueError("response truncated at the max_tokens limit")
+            if getattr(choice.message, "refusal", None):
+                raise ValueError(f"model refused: {choice.message.refusal}")
             
-            if len(parts) == 2:
-                recommendation = parts[0].strip().upper()
-                rationale = parts[1].strip()
-                
-                # Ensure recommendation is valid
-                if recommendation not in ["BUY", "SELL", "HOLD"]:
-                    recommendation = "HOLD"
+            # The schema guarantees both fields and a valid recommendation value
+            parsed = orjson.loads(choice.message.content)
             
-            return {
-                "ticker": metrics['ticker'],
-                "recommendation": recommendation,
-                "rationale": rationale,
-                "date": datetime.now().strftime("%Y-%m-%d")
+            rec = {
+                "ticker": ticker,
+                "recommendation": parsed["recommendation"],
+                "rationale": parsed["rationale"].strip(),
+                "date": today_iso
             }
+            self.cache.set(key, rec, expire=self.cache_ttl)
+            return rec
             
         except Exception as e:
-            print(f"Error getting recommendation for {metrics['ticker']}: {e}")
+            print(f"Error getting recommendation for {ticker}: {e}")
             return {
-                "ticker": metrics['ticker'],
+                "ticker": ticker,
                 "recommendation": "HOLD",
                 "rationale": "Error in analysis",
-                "date": datetime.now().strftime("%Y-%m-%d")
+                "date": today_iso
             }
 
+    async def _fetch_metrics(self, ticker: str, today_iso: str) -> Dict:
+        """Fetch fundamentals for one ticker within the Yahoo rate limit"""
+        print(f"Analyzing {ticker}...")
+        # Cached fundamentals return before the Yahoo rate limit is touched
+        return await self.fetch_stock_data(ticker, today_iso)
+
+    async def _fetch_worker(self, tickers: asyncio.Queue, fetched: asyncio.Queue, today_iso: str):
+        """Fetch fundamentals for queued tickers and hand them to the recommendation stage"""
+        while True:
+            try:
+                ticker = tickers.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                metrics = await self._fetch_metrics(ticker, today_iso)
+            except Exception as e:
+                print(f"Error analyzing {ticker}: {e}")
+                continue
+            if metrics:
+                # Blocks while the recommendation stage is behind
+                await fetched.put(metrics)
+
+    async def _recommend_worker(self, fetched: asyncio.Queue, sink, today_iso: str):
+        """Turn fetched fundamentals into recommendations until a None sentinel arrives"""
+        while (metrics := await fetched.get()) is not None:
+            try:
+                rec = await self.get_gpt4_recommendation(metrics, metrics['ticker'], today_iso)
+            except Exception as e:
+                print(f"Error analyzing {metrics['ticker']}: {e}")
+                continue
+            try:
+                sink(rec)
+            except OSError as e:
+                # A failed write is not per-ticker; stop the pipeline rather than drop results
+                print(f"Error writing recommendation for {rec['ticker']}: {e}")
+                raise
+
+    async def _fetch_stage(self, tickers: asyncio.Queue, fetched: asyncio.Queue, today_iso: str):
+        """Run the fetch workers, then send each recommendation worker its None sentinel"""
+        await _gather_or_cancel(
+            *(self._fetch_worker(tickers, fetched, today_iso) for _ in range(self.fetch_workers))
+        )
+        for _ in range(self.recommend_workers):
+            await fetched.put(None)
+
     async def update_recommendations(self):
         """Update stock recommendations"""
         print("\nUpdating stock recommendations...")
         
         # Get S&P 500 tickers
-        tickers = self.get_sp500_tickers()
+        tickers = get_sp500_tickers()
+        today_iso = date.today().isoformat()
+        
+        data_dir = self.root_dir / "src/data"
+        data_dir.mkdir(parents=True, exist_ok=True)
+        ndjson_path = data_dir / "recommendations.ndjson"
+        json_path = data_dir / "recommendations.json"
         
-        # Fetch data and get recommendations
-        recommendations = []
+        # Fetchers feed a bounded queue drained by the recommendation workers, so each
+        # stage runs at its own rate limit; recommendations are appended as they finish
+        # so a crash keeps the completed work
+        tickers_queue = asyncio.Queue()
         for ticker in tickers:
-            print(f"Analyzing {ticker}...")
-            metrics = self.fetch_stock_data(ticker)
-            if metrics:
-                rec = await self.get_gpt4_recommendation(metrics)
-                recommendations.append(rec)
-                # Small delay to respect API rate limits
-                await asyncio.sleep(1)
+            tickers_queue.put_nowait(ticker)
+        fetched = asyncio.Queue(maxsize=self.queue_size)
+        written = 0
         
-        # Save recommendations
-        data_dir = self.root_dir / "src/data"
-        data_dir.mkdir(exist_ok=True)
+        with open(ndjson_path, "wb") as f:
+            def write(rec):
+                nonlocal written
+                f.write(orjson.dumps(rec) + b"\n")
+                f.flush()
+                written += 1
+            
+            # A failure in either stage cancels the other instead of leaving it blocked on the queue
+            await _gather_or_cancel(
+                *(self._recommend_worker(fetched, write, today_iso) for _ in range(self.recommend_workers)),
+                self._fetch_stage(tickers_queue, fetched, today_iso)
+            )
         
-        with open(data_dir / "recommendations.json", "w") as f:
-            json.dump(recommendations, f, indent=2)
+        # The site reads a JSON array, so convert the stream once at the end
+        if written:
+            recommendations = pd.read_json(ndjson_path, lines=True, dtype=False, convert_dates=False)
+            recommendations.sort_values("ticker").to_json(json_path, orient="records", indent=2)
+        else:
+            json_path.write_text("[]")
         
-        print(f"\nRecommendations updated successfully at: {data_dir / 'recommendations.json'}")
+        print(f"\nRecommendations updated successfully at: {json_path}")
 
-if __name__ == "__main__":
+async def main():
     generator = RecommendationsGenerator()
-    asyncio.run(generator.update_recommendations()) 
\ No newline at end of file
+    try:
+        await generator.update_recommendations()
+    finally:
+        await close_openai_clients()
+
+if __name__ == "__main__":
+    run(main()) 
\ No newline at end of file
@@ -0,0 +1,12 @@
+import functools
+import os
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+@functools.lru_cache(maxsize=4)
+def get_gemini_llm(model: str = "gemini-1.5-flash-latest", temperature: float = 0) -> ChatGoogleGenerativeAI:
+    """Process-wide Gemini chat model so agents share one client and its connections"""
+    return ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=temperature
+    )
@@ -1,9 +1,10 @@
+import hashlib
+import json
 from typing import Dict, List
+import diskcache
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
-import os
+from .llm_client import get_gemini_llm
 
 class Step(BaseModel):
     """Schema for each decomposition step"""
@@ -12,6 +13,7 @@ class Step(BaseModel):
     required_data: List[str] = Field(description="List of data points needed from YFinance")
     time_period: str = Field(description="Required time range")
     frequency: str = Field(description="Data frequency (daily, quarterly, yearly)")
+    depends_on: List[int] = Field(default_factory=list, description="Step numbers whose results this step needs")
 
 class QueryDecomposition(BaseModel):
     """Schema for the complete decomposition"""
@@ -26,14 +28,14 @@ class QueryDecomposer:
     
     def __init__(self):
         # Initialize the LLM
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash-latest",
-            google_api_key=os.getenv("GOOGLE_API_KEY"),
-            temperature=0
-        )
+        self.llm = get_gemini_llm()
         
-        # Initialize the output parser
-        self.parser = JsonOutputParser(pydantic_object=QueryDecomposition)
+        # Identical queries reuse a recent decomposition instead of another LLM round trip
+        self.cache = diskcache.Cache(".cache/decompositions")
+        self.cache_ttl = 24 * 60 * 60  # seconds
+        
+        # Gemini returns the decomposition as schema-validated JSON, so no free-text parsing is needed
+        self.structured_llm = self.llm.with_structured_output(QueryDecomposition)
         
         # Create the prompt template with YFinance data awareness
         self.prompt = ChatPromptTemplate.from_messages([
@@ -93,24 +95,44 @@ When breaking down queries:
 2. Specify time periods needed (e.g., last quarter, TTM, 5 years)
 3. Define the frequency of data needed (daily, quarterly, yearly)
 4. Consider any calculations or comparisons needed
-5. if the data is retrievd already, do not retrieve it again and use the data to do the next steps to answer the query of the user
-
-{format_instructions}"""),
+5. if the data is retrievd already, do not retrieve it again and use the data to do the next steps to answer the query of the user"""),
             ("user", "{query}")
         ])
+        
+        # The chain is static, so build it once rather than per query
+        self.chain = self.prompt | self.structured_llm
+        
+        # Prompt or schema edits must not serve plans cached under the old ones
+        templates = [message.prompt.template for message in self.prompt.messages]
+        schema = QueryDecomposition.model_json_schema()
+        self._cache_version = hashlib.sha256(
+            json.dumps([templates, schema], sort_keys=True).encode()
+        ).hexdigest()
+
+    def _cache_key(self, query: str) -> str:
+        """Cache key over the model, prompt and schema version, and the whitespace-normalized query"""
+        normalized = " ".join(query.split())
+        return hashlib.sha256(f"{self.llm.model}:{self._cache_version}:{normalized}".encode()).hexdigest()
 
     async def decompose_query(self, query: str) -> Dict:
         """Decompose a natural language query into structured steps."""
+        key = self._cache_key(query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
         try:
-            # Create the chain
-            chain = self.prompt | self.llm | self.parser
-            
             # Run the chain
-            result = await chain.ainvoke({
-                "query": query,
-                "format_instructions": self.parser.get_format_instructions()
-            })
+            decomposition = await self.chain.ainvoke({"query": query})
+            
+            # Fail fast on an empty or refused response rather than caching it
+            if decomposition is None or not decomposition.steps:
+                print(f"Error decomposing query: model returned no steps for {query!r}")
+                return None
+            
+            result = decomposition.model_dump()
             
+            self.cache.set(key, result, expire=self.cache_ttl)
             return result
             
         except Exception as e:
@@ -1,6 +1,9 @@
 from enum import Enum
 from typing import Dict, Tuple
 
+# Step descriptions containing any of these words are routed to the data retrieval agent
+DATA_RETRIEVAL_KEYWORDS = ("get", "fetch", "retrieve", "find")
+
 class AgentType(Enum):
     DATA_RETRIEVAL = "data_retrieval"
     CALCULATION = "calculation"
@@ -16,7 +19,7 @@ class StepClassifier:
         required_data = step["required_data"]
         
         # Data Retrieval steps
-        if any(keyword in description for keyword in ["get", "fetch", "retrieve", "find"]):
+        if any(keyword in description for keyword in DATA_RETRIEVAL_KEYWORDS):
             return AgentType.DATA_RETRIEVAL, "Fetch required data from YFinance"
             
         # Calculation steps
@@ -1,4 +1,5 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional
+from aiolimiter import AsyncLimiter
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel, Field
@@ -9,12 +10,11 @@ from rich.console import Console
 from rich.table import Table
 import asyncio
 from yfinance_metrics import get_sp500_tickers, fetch_fundamentals
-import time
 
 class StockRecommendation(BaseModel):
     """Schema for stock recommendations"""
     ticker: str = Field(description="Stock ticker symbol")
-    recommendation: str = Field(description="Buy, Sell, or Hold recommendation")
+    recommendation: Literal["BUY", "SELL", "HOLD"] = Field(description="Buy, Sell, or Hold recommendation")
     confidence: float = Field(description="Confidence score between 0 and 1")
     rationale: str = Field(description="Brief rationale for the recommendation")
 
@@ -27,13 +27,19 @@ class StockAnalystAgent:
         self.llm = ChatGoogleGenerativeAI(
             model="gemini-1.5-flash-latest",
             google_api_key=os.getenv("GOOGLE_API_KEY"),
-            temperature=0
+            temperature=0,
+            # The client retries quota and availability errors itself; keep that the only retry layer
+            max_retries=5
         )
+        # Have the model return a StockRecommendation directly instead of pipe-delimited text
+        self.structured_llm = self.llm.with_structured_output(StockRecommendation)
         
-        # Initialize rate limiting parameters
+        # Initialize rate limiting parameters: requests are paced proactively by a
+        # per-minute limiter and capped in flight by a semaphore
         self.rate_limit = 15  # requests per minute
-        self.last_request_time = time.time()
-        self.request_count = 0
+        self.max_concurrent = 4
+        self._limiter = AsyncLimiter(self.rate_limit, 60)
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
         
         self.recommendation_prompt = ChatPromptTemplate.from_messages([
             ("system", """You are an expert stock analyst. Analyze the given stock data and provide a recommendation.
@@ -44,60 +50,36 @@ class StockAnalystAgent:
             4. Market Position: Market cap, Industry rank
             5. Risk Metrics: Beta, Debt/Equity
             
-            Respond in exactly this format:
-            BUY|0.95|Strong growth and reasonable valuation
-            or
-            SELL|0.80|Declining margins and high valuation
-            or
-            HOLD|0.70|Fair valuation but uncertain growth
+            Give a recommendation of BUY, SELL, or HOLD, a confidence score between 0 and 1,
+            and a brief rationale, e.g. BUY with 0.95 confidence: "Strong growth and reasonable valuation".
             
             Only these three words (BUY/SELL/HOLD) are allowed."""),
             ("user", """Stock: {ticker}
             Metrics:
             {metrics}""")
         ])
-
-    async def _enforce_rate_limit(self):
-        """Enforce rate limiting for API calls"""
-        current_time = time.time()
-        if current_time - self.last_request_time < 60:  # within the same minute
-            if self.request_count >= self.rate_limit:
-                wait_time = 60 - (current_time - self.last_request_time)
-                print(f"Rate limit reached. Waiting {wait_time:.2f} seconds...")
-                await asyncio.sleep(wait_time)
-                self.request_count = 0
-                self.last_request_time = time.time()
-        else:
-            # Reset counters for new minute
-            self.request_count = 0
-            self.last_request_time = current_time
         
-        self.request_count += 1
+        # The chain is static, so build it once rather than per ticker
+        self.recommendation_chain = self.recommendation_prompt | self.structured_llm
+
+    async def _invoke_recommendation(self, ticker: str, metrics_str: str) -> StockRecommendation:
+        """Call Gemini within the rate limit and concurrency cap"""
+        async with self._semaphore, self._limiter:
+            return await self.recommendation_chain.ainvoke({
+                "ticker": ticker,
+                "metrics": metrics_str
+            })
 
     async def get_recommendation(self, ticker: str, metrics: Dict) -> StockRecommendation:
         """Get recommendation for a single stock"""
         try:
-            await self._enforce_rate_limit()
-            
             # Format metrics for the prompt
             metrics_str = "\n".join([f"{k}: {v}" for k, v in metrics.items()])
             
             # Get recommendation from Gemini
-            chain = self.recommendation_prompt | self.llm
-            response = await chain.ainvoke({
-                "ticker": ticker,
-                "metrics": metrics_str
-            })
+            recommendation = await self._invoke_recommendation(ticker, metrics_str)
             
-            # Parse response
-            rec, conf, rationale = response.content.strip().split("|")
-            
-            return StockRecommendation(
-                ticker=ticker,
-                recommendation=rec.strip().upper(),
-                confidence=float(conf.strip()),
-                rationale=rationale.strip()
-            )
+            return recommendation.model_copy(update={"ticker": ticker})
             
         except Exception as e:
             print(f"Error getting recommendation for {ticker}: {e}")
@@ -110,12 +92,12 @@ class StockAnalystAgent:
         # Fetch fundamentals for all stocks
         fundamentals_df = fetch_fundamentals(tickers)
         
-        # Get recommendations with rate limiting
-        recommendations = []
-        for _, row in fundamentals_df.iterrows():
-            rec = await self.get_recommendation(row['Ticker'], row.to_dict())
-            if rec:
-                recommendations.append(rec)
+        # Get recommendations concurrently; the limiter and semaphore pace the requests
+        results = await asyncio.gather(*(
+            self.get_recommendation(row['Ticker'], row.to_dict())
+            for _, row in fundamentals_df.iterrows()
+        ))
+        recommendations = [rec for rec in results if rec]
         
         # Convert to DataFrame
         df = pd.DataFrame([r.dict() for r in recommendations])
@@ -1,11 +1,27 @@
+import functools
+import orjson
+import time
+from pathlib import Path
 import yfinance as yf
 import pandas as pd
 
+SP500_CACHE_PATH = Path(".cache/sp500.json")
+SP500_CACHE_MAX_AGE = 7 * 24 * 60 * 60  # seconds
+
+@functools.lru_cache(maxsize=1)
 def get_sp500_tickers():
+    # Reuse a recent scrape from disk; membership only changes a few times a quarter
+    if SP500_CACHE_PATH.exists() and time.time() - SP500_CACHE_PATH.stat().st_mtime < SP500_CACHE_MAX_AGE:
+        return tuple(orjson.loads(SP500_CACHE_PATH.read_bytes()))
+    
     url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
     table = pd.read_html(url)[0]  # Read the first table on the page
     tickers = table["Symbol"].tolist()
-    return tickers
+    
+    SP500_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    SP500_CACHE_PATH.write_bytes(orjson.dumps(tickers))
+    # Every caller shares the memoized result, so hand out an immutable tuple
+    return tuple(tickers)
 
 def get_top_10_companies(tickers):
     data = []
@@ -1,6 +1,6 @@
-import asyncio
 from agents.query_decomposer import QueryDecomposer
 from agents.data_retrieval_agent import DataRetrievalAgent
+from agents.event_loop import run
 import json
 import pandas as pd
 
@@ -79,4 +79,4 @@ async def main():
 
 if __name__ == "__main__":
     print("Starting Sankhya Finance analysis...")
-    asyncio.run(main())
\ No newline at end of file
+    run(main())
\ No newline at end of file